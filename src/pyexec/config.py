@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -10,6 +10,12 @@ class Settings(BaseSettings):
 
     # Optional Redis settings
     REDIS_URL: Optional[str] = None
+    # Shard task statuses across several instances; falls back to REDIS_URL
+    REDIS_URLS: List[str] = []
+    REDIS_MAX_CONNECTIONS: int = 100
+    REDIS_SOCKET_TIMEOUT: float = 2.0
+    STATUS_CACHE_TTL: float = 1.0
+    STATUS_CACHE_MAXSIZE: int = 10000
 
     # Optional S3 settings
     S3_BUCKET_NAME: Optional[str] = None
@@ -18,6 +24,25 @@ class Settings(BaseSettings):
     AWS_REGION: Optional[str] = None
     BASE_IMAGE_NAME: str = "pyexec-base"
 
+    # Optional Docker volume holding pip's wheel cache, shared by all installs.
+    # Off by default: installs run untrusted build code, so a shared writable cache
+    # lets one session plant wheels that another session's install will use.
+    PIP_CACHE_VOLUME: Optional[str] = None
+
+    # Background worker threads. Install/execute threads mostly wait on Docker, so
+    # this bounds concurrent tasks rather than CPU use.
+    COMPUTE_POOL_MAX_WORKERS: int = 40
+    IO_POOL_MAX_WORKERS: int = 64
+
+    # Session containers are removed once the session directory has been unused
+    # for this many seconds and no code is running in them
+    SESSION_CONTAINER_IDLE_TIMEOUT: int = 600
+    SESSION_CONTAINER_REAP_INTERVAL: int = 60
+
+    # How long a session's virtual environment is remembered to exist (seconds)
+    VENV_EXISTS_CACHE_TTL: float = 30.0
+    VENV_EXISTS_CACHE_MAXSIZE: int = 10000
+
     class Config:
         env_file = ".env"
 
@@ -1,10 +1,24 @@
+import asyncio
+import codecs
+import functools
+import hashlib
+import hmac
+import io
 import logging
 import os
 import shutil
+import socket
 import subprocess
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import asynccontextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 import docker
+from docker.utils.socket import consume_socket_output, frames_iter
 
 from fastapi import (
     Depends,
@@ -17,12 +31,16 @@ from fastapi import (
     BackgroundTasks,
     Request,
 )
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse
 from pydantic import BaseModel, Field
 from fastapi.security import APIKeyHeader
+from cachetools import TTLCache
 import redis
-import json
+import redis.asyncio as aioredis
+import orjson
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config as BotoConfig
 from botocore.exceptions import NoCredentialsError
 
 from .config import settings
@@ -35,7 +53,21 @@ logger = logging.getLogger(__name__)
 
 api_key_header = APIKeyHeader(name=settings.API_KEY_NAME, auto_error=True)
 
-app = FastAPI()
+# Settings read on hot paths, bound once at import
+API_KEY = settings.API_KEY
+BASE_SESSION_PATH = settings.BASE_SESSION_PATH
+BASE_IMAGE_NAME = settings.BASE_IMAGE_NAME
+S3_BUCKET_NAME = settings.S3_BUCKET_NAME
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    reaper = asyncio.create_task(reap_idle_containers_periodically())
+    yield
+    reaper.cancel()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 
 @app.exception_handler(Exception)
@@ -67,11 +99,11 @@ class TerminateSessionRequest(BaseModel):
 
 def get_session_path(session_id: str) -> Path:
     """Get the path to the session directory."""
-    return settings.BASE_SESSION_PATH / session_id
+    return BASE_SESSION_PATH / session_id
 
 
 async def get_api_key(api_key_header: str = Security(api_key_header)):
-    if api_key_header == settings.API_KEY:
+    if hmac.compare_digest(api_key_header.encode("utf-8"), API_KEY.encode("utf-8")):
         return api_key_header
     else:
         raise HTTPException(status_code=403, detail="Could not validate credentials")
@@ -84,11 +116,50 @@ router = APIRouter(dependencies=[Depends(get_api_key)])
 
 
 # --- Service Clients ---
-redis_client = redis.from_url(settings.REDIS_URL) if settings.REDIS_URL else None
+# Task statuses are sharded across one or more Redis instances by task id.
+redis_urls = settings.REDIS_URLS or ([settings.REDIS_URL] if settings.REDIS_URL else [])
+redis_pool_options = dict(
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+    health_check_interval=30,
+)
+redis_clients = [
+    redis.Redis(
+        connection_pool=redis.ConnectionPool.from_url(url, **redis_pool_options)
+    )
+    for url in redis_urls
+]
+
+# Async clients for request handlers, so status reads don't block the event loop.
+# Background tasks run in the threadpool and keep using the sync clients above.
+aioredis_clients = [
+    aioredis.Redis(
+        connection_pool=aioredis.ConnectionPool.from_url(url, **redis_pool_options)
+    )
+    for url in redis_urls
+]
+
+# Unsharded data (e.g. session container bookkeeping) lives on the first instance
+redis_client = redis_clients[0] if redis_clients else None
 
 # Fallback in-memory storage if Redis is not configured
 task_statuses: Dict[str, Any] = {} if not redis_client else None
 
+# Short-lived local cache in front of Redis for hot status polling. Writes go
+# through it, so staleness is bounded by the TTL only across workers.
+status_cache = TTLCache(
+    maxsize=settings.STATUS_CACHE_MAXSIZE, ttl=settings.STATUS_CACHE_TTL
+)
+status_cache_lock = threading.Lock()
+
+
+# Docker client, shared by all background tasks. Created on first use so the app
+# can start (and serve /health and /status) while the daemon is unavailable.
+@functools.lru_cache(maxsize=None)
+def get_docker_client() -> docker.DockerClient:
+    return docker.from_env()
+
+
 # S3 client
 s3_client = (
     boto3.client(
@@ -96,26 +167,108 @@ s3_client = (
         aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
         aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
         region_name=settings.AWS_REGION,
+        config=BotoConfig(
+            max_pool_connections=64,
+            retries={"max_attempts": 10, "mode": "adaptive"},
+            tcp_keepalive=True,
+        ),
     )
-    if settings.S3_BUCKET_NAME
+    if S3_BUCKET_NAME
     else None
 )
 
+# Background work is split so slow S3 transfers can't starve code execution:
+# installs and executions run on the compute pool, S3 transfers on the I/O pool.
+compute_pool = ThreadPoolExecutor(
+    max_workers=settings.COMPUTE_POOL_MAX_WORKERS, thread_name_prefix="pyexec-compute"
+)
+io_pool = ThreadPoolExecutor(
+    max_workers=settings.IO_POOL_MAX_WORKERS, thread_name_prefix="pyexec-io"
+)
+
+# Multipart settings for streaming uploads to S3
+S3_UPLOAD_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=16,
+    use_threads=True,
+)
+
 
 # --- Helper Functions ---
+async def run_in_pool(pool: ThreadPoolExecutor, func, *args):
+    """Run a blocking function on the given executor without blocking the event loop."""
+    await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+
+
+def encode_status_fields(fields: dict) -> Dict[str, bytes]:
+    """Serialize each status field on its own so fields can be updated individually."""
+    return {key: orjson.dumps(value) for key, value in fields.items()}
+
+
+def decode_status_fields(fields: Dict[bytes, bytes]) -> dict:
+    """Deserialize status fields read back from a Redis hash."""
+    return {key.decode("utf-8"): orjson.loads(value) for key, value in fields.items()}
+
+
+def get_status_shard(task_id: str) -> int:
+    """Get the index of the Redis shard that stores a task's status."""
+    return zlib.crc32(task_id.encode("utf-8")) % len(redis_clients)
+
+
+def get_status_key(task_id: str, shard: int) -> str:
+    """Get the namespaced Redis key for a task's status."""
+    return f"pyexec:{shard}:status:{task_id}"
+
+
 def set_status(task_id: str, status: dict, ex: int = 3600):
     """Set the status of a task, using Redis if available."""
-    if redis_client:
-        redis_client.set(task_id, json.dumps(status), ex=ex)
+    if redis_clients:
+        shard = get_status_shard(task_id)
+        key = get_status_key(task_id, shard)
+        # MULTI/EXEC so readers never see the key between DEL and HSET
+        with redis_clients[shard].pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            pipe.hset(key, mapping=encode_status_fields(status))
+            pipe.expire(key, ex)
+            pipe.execute()
+        with status_cache_lock:
+            status_cache[task_id] = status
     else:
         task_statuses[task_id] = status
 
 
-def get_status_from_store(task_id: str) -> Optional[dict]:
+def update_status(task_id: str, fields: dict, ex: int = 3600):
+    """Update individual fields of a task's status, using Redis if available."""
+    if redis_clients:
+        shard = get_status_shard(task_id)
+        key = get_status_key(task_id, shard)
+        with redis_clients[shard].pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping=encode_status_fields(fields))
+            pipe.expire(key, ex)
+            pipe.execute()
+        with status_cache_lock:
+            status_cache.pop(task_id, None)
+    else:
+        task_statuses.setdefault(task_id, {}).update(fields)
+
+
+async def get_status_from_store(task_id: str) -> Optional[dict]:
     """Get the status of a task, using Redis if available."""
-    if redis_client:
-        status_json = redis_client.get(task_id)
-        return json.loads(status_json) if status_json else None
+    if aioredis_clients:
+        with status_cache_lock:
+            status = status_cache.get(task_id)
+        if status is not None:
+            return status
+
+        shard = get_status_shard(task_id)
+        fields = await aioredis_clients[shard].hgetall(get_status_key(task_id, shard))
+        if not fields:
+            return None
+        status = decode_status_fields(fields)
+        with status_cache_lock:
+            status_cache[task_id] = status
+        return status
     return task_statuses.get(task_id)
 
 
@@ -124,104 +277,646 @@ def get_session_venv_path(session_path: Path) -> Path:
     return session_path / "venv" / "bin" / "python"
 
 
+@functools.lru_cache(maxsize=4096)
+def get_session_paths(session_id: str) -> Tuple[str, str]:
+    """Get the session directory and venv python paths as strings, cached per session."""
+    session_path = get_session_path(session_id)
+    return str(session_path), str(get_session_venv_path(session_path))
+
+
+# Sessions known to have a virtual environment, so executions can skip the stat
+# (slow on network-backed session volumes). Only positive results are cached and
+# entries expire, so venvs created or removed by other workers are picked up.
+venv_exists_cache = TTLCache(
+    maxsize=settings.VENV_EXISTS_CACHE_MAXSIZE, ttl=settings.VENV_EXISTS_CACHE_TTL
+)
+venv_exists_cache_lock = threading.Lock()
+
+
+def venv_exists(session_id: str, venv_python: str) -> bool:
+    """Check whether a session's virtual environment exists, using the cache if possible."""
+    with venv_exists_cache_lock:
+        if venv_exists_cache.get(session_id):
+            return True
+    if not os.path.exists(venv_python):
+        return False
+    remember_venv(session_id)
+    return True
+
+
+def remember_venv(session_id: str):
+    """Record in the cache that a session's virtual environment exists."""
+    with venv_exists_cache_lock:
+        venv_exists_cache[session_id] = True
+
+
+def forget_venv(session_id: str):
+    """Drop a session from the virtual environment existence cache."""
+    with venv_exists_cache_lock:
+        venv_exists_cache.pop(session_id, None)
+
+
+# Install logs are pushed to the task status at most this often, or sooner once
+# this many new characters have accumulated.
+INSTALL_LOG_FLUSH_INTERVAL = 0.25
+INSTALL_LOG_FLUSH_SIZE = 4096
+
+
+class InstallLogBuffer:
+    """Accumulates install output and publishes it to the task status in batches."""
+
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.text = ""
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+    def write(self, text: str):
+        self.text += text
+        self.unflushed += len(text)
+        if (
+            self.unflushed >= INSTALL_LOG_FLUSH_SIZE
+            or time.monotonic() - self.last_flush >= INSTALL_LOG_FLUSH_INTERVAL
+        ):
+            self.flush()
+
+    def flush(self):
+        if self.unflushed:
+            update_status(self.task_id, {"logs": self.text})
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+
+def run_install_step(log: InstallLogBuffer, command: List[str], **kwargs):
+    """Run a command in a disposable container, streaming its output into the install log.
+
+    Both stdout and stderr are streamed into the log. Returns the exit code.
+    """
+    container = get_docker_client().containers.create(
+        image=BASE_IMAGE_NAME,
+        command=command,
+        working_dir="/app",
+        user="appuser",
+        **kwargs,
+    )
+    try:
+        container.start()
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        for chunk in container.logs(stream=True, follow=True):
+            log.write(decoder.decode(chunk))
+        log.write(decoder.decode(b"", final=True))
+
+        return container.wait()["StatusCode"]
+    finally:
+        container.remove(force=True)
+
+
 def do_install(session_id: str, packages: List[str]):
     """Install packages into a session's virtual environment using a disposable container."""
     task_id = f"install-{session_id}"
     set_status(task_id, {"status": "installing", "logs": ""})
 
-    session_path = get_session_path(session_id)
-    session_path.mkdir(parents=True, exist_ok=True)
-    venv_python = get_session_venv_path(session_path)
+    session_dir, venv_python = get_session_paths(session_id)
+    os.makedirs(session_dir, exist_ok=True)
 
-    client = docker.from_env()
-    log_output = ""
+    log = InstallLogBuffer(task_id)
 
     try:
+        steps = []
         # Step 1: Create venv if it doesn't exist
-        if not venv_python.exists():
-            log_output += "Creating virtual environment...\n"
-            create_venv_command = ["python", "-m", "venv", "venv"]
-            container = client.containers.run(
-                image=settings.BASE_IMAGE_NAME,
-                command=create_venv_command,
-                volumes={str(session_path): {"bind": "/app", "mode": "rw"}},
-                working_dir="/app",
-                user="appuser",
-                remove=True,
-                detach=False,
+        if not venv_exists(session_id, venv_python):
+            steps.append(
+                (
+                    "Creating virtual environment...\n",
+                    ["python", "-m", "venv", "venv"],
+                    {"volumes": {session_dir: {"bind": "/app", "mode": "rw"}}},
+                )
             )
-            log_output += container.decode("utf-8")
 
         # Step 2: Install packages using the venv pip
-        log_output += f"Installing packages: {' '.join(packages)}...\n"
-        pip_install_command = [str(venv_python), "-m", "pip", "install"] + packages
-        container = client.containers.run(
-            image=settings.BASE_IMAGE_NAME,
-            command=pip_install_command,
-            volumes={str(session_path): {"bind": "/app", "mode": "rw"}},
-            working_dir="/app",
-            user="appuser",
-            remove=True,
-            detach=False,
+        pip_install_command = [
+            venv_python,
+            "-m",
+            "pip",
+            "install",
+            "--prefer-binary",
+            "--disable-pip-version-check",
+        ] + packages
+        volumes = {session_dir: {"bind": "/app", "mode": "rw"}}
+        if settings.PIP_CACHE_VOLUME:
+            # Shared across sessions so repeat installs reuse downloaded and built wheels
+            volumes[settings.PIP_CACHE_VOLUME] = {
+                "bind": "/home/appuser/.cache/pip",
+                "mode": "rw",
+            }
+        steps.append(
+            (
+                f"Installing packages: {' '.join(packages)}...\n",
+                pip_install_command,
+                {
+                    "volumes": volumes,
+                    "environment": {
+                        "PIP_NO_INPUT": "1",
+                        "PIP_DISABLE_PIP_VERSION_CHECK": "1",
+                    },
+                },
+            )
         )
-        log_output += container.decode("utf-8")
 
-        set_status(task_id, {"status": "success", "logs": log_output})
+        for message, command, kwargs in steps:
+            log.write(message)
+            exit_code = run_install_step(log, command, **kwargs)
+            if exit_code != 0:
+                # stderr is already in the log, streamed alongside stdout
+                set_status(
+                    task_id,
+                    {
+                        "status": "failed",
+                        "logs": log.text,
+                        "error": f"Command {command!r} returned non-zero exit status {exit_code}",
+                        "exit_code": exit_code,
+                    },
+                )
+                return
+
+        remember_venv(session_id)
+        set_status(task_id, {"status": "success", "logs": log.text})
 
-    except docker.errors.ContainerError as e:
-        log_output += f"\nError during installation: {e.stderr.decode('utf-8')}"
-        set_status(task_id, {"status": "failed", "logs": log_output, "error": str(e)})
     except Exception as e:
-        set_status(task_id, {"status": "failed", "error": str(e), "logs": log_output})
+        set_status(task_id, {"status": "failed", "error": str(e), "logs": log.text})
+
 
+UPLOAD_COPY_BUFFER_SIZE = 1024 * 1024
 
-def download_from_s3(session_id: str, filename: str, local_path: Path):
+
+def copy_upload(source, destination):
+    """Copy an uploaded file, using a zero-copy sendfile when it is backed by a real file."""
+    # Spooled uploads still in memory would be forced to disk by fileno(), so only
+    # take the sendfile path once they have rolled over.
+    if getattr(source, "_rolled", True):
+        try:
+            in_fd = source.fileno()
+            out_fd = destination.fileno()
+            start = source.tell()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            pass
+        else:
+            offset = start
+            try:
+                remaining = os.fstat(in_fd).st_size - offset
+                while remaining > 0:
+                    sent = os.sendfile(out_fd, in_fd, offset, remaining)
+                    if sent == 0:
+                        break
+                    offset += sent
+                    remaining -= sent
+                source.seek(offset)
+                return
+            except OSError:
+                # Start over with a plain copy from where we began
+                source.seek(start)
+                destination.seek(0)
+                destination.truncate()
+    shutil.copyfileobj(source, destination, length=UPLOAD_COPY_BUFFER_SIZE)
+
+
+# Below this size a single GET is cheaper than going through the transfer manager
+S3_SMALL_OBJECT_SIZE = 5 * 1024 * 1024
+
+
+def download_from_s3(
+    session_id: str, filename: str, local_path: Path, size: Optional[int] = None
+):
     """Download a file from S3 to a local path."""
+    key = f"{session_id}/{filename}"
     try:
-        s3_client.download_file(
-            settings.S3_BUCKET_NAME, f"{session_id}/{filename}", str(local_path)
-        )
+        if size is not None and size < S3_SMALL_OBJECT_SIZE:
+            body = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=key)["Body"]
+            # Like download_file, write to a temp file so a failed or concurrent
+            # download never leaves a partial file in the session
+            fd, temp_path = tempfile.mkstemp(
+                dir=local_path.parent, prefix=f".{filename}.", suffix=".part"
+            )
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    shutil.copyfileobj(body, f, length=1024 * 1024)
+                os.replace(temp_path, local_path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        else:
+            s3_client.download_file(S3_BUCKET_NAME, key, str(local_path))
         return True
     except NoCredentialsError:
+        # Every other download would fail the same way, so let the caller abort
         logger.error("S3 credentials not available.")
-        return False
+        raise
     except Exception as e:
         logger.error(f"Error downloading from S3: {e}")
         return False
 
 
-def do_execute(session_id: str, code: str, env: Dict[str, str], task_key: str):
-    """Execute code in a disposable container using the session's virtual environment."""
-    set_status(task_key, {"status": "running"})
+# S3 sync tuning: objects larger than one part are fetched as parallel byte ranges.
+S3_RANGE_PART_SIZE = 8 * 1024 * 1024
+S3_RANGE_CHUNK_SIZE = 1024 * 1024
+
+
+def download_s3_range(key: str, local_path: str, start: int, end: int):
+    """Download the inclusive byte range [start, end] of an S3 object into a preallocated file."""
+    body = s3_client.get_object(
+        Bucket=S3_BUCKET_NAME, Key=key, Range=f"bytes={start}-{end}"
+    )["Body"]
+    fd = os.open(local_path, os.O_WRONLY)
+    try:
+        # Stream in chunks rather than holding the whole part in memory
+        offset = start
+        for chunk in iter(lambda: body.read(S3_RANGE_CHUNK_SIZE), b""):
+            os.pwrite(fd, chunk, offset)
+            offset += len(chunk)
+    finally:
+        os.close(fd)
+
+
+# Upper bound on queued S3 downloads, so listing can't run far ahead of transfers
+S3_SYNC_MAX_PENDING = 128
 
-    session_path = get_session_path(session_id)
-    session_path.mkdir(parents=True, exist_ok=True)
 
-    code_file_path = session_path / "temp_code.py"
-    with code_file_path.open("w") as code_file:
-        code_file.write(code)
+def iter_session_objects(session_id: str):
+    """Yield the S3 objects directly under a session's prefix, one listing page at a time."""
+    params = {
+        "Bucket": S3_BUCKET_NAME,
+        "Prefix": f"{session_id}/",
+        "Delimiter": "/",
+    }
+    while True:
+        response = s3_client.list_objects_v2(**params)
+        yield from response.get("Contents", [])
+        if not response.get("IsTruncated"):
+            return
+        params["ContinuationToken"] = response["NextContinuationToken"]
+
+
+def sync_session_from_s3(session_id: str, session_path: Path):
+    """Download all of a session's S3 objects into its directory in parallel."""
+    pending = set()
+    # Large objects are assembled from ranged parts in a temp file, which only
+    # replaces the session file once every part has arrived.
+    ranged_downloads: Dict[Any, dict] = {}
+    open_downloads: Dict[str, dict] = {}
+
+    def release(download):
+        download["remaining"] -= 1
+        if download["remaining"] > 0:
+            return
+        del open_downloads[download["temp_path"]]
+        if download["failed"]:
+            os.unlink(download["temp_path"])
+        else:
+            os.replace(download["temp_path"], download["local_path"])
+
+    def drain(return_when):
+        nonlocal pending
+        done, pending = wait(pending, return_when=return_when)
+        for future in done:
+            download = ranged_downloads.pop(future, None)
+            try:
+                future.result()
+            except Exception as e:
+                if download is not None:
+                    download["failed"] = True
+                if isinstance(e, NoCredentialsError):
+                    raise
+                logger.error(f"Error downloading from S3: {e}")
+            finally:
+                if download is not None:
+                    release(download)
+
+    try:
+        for obj in iter_session_objects(session_id):
+            key = obj["Key"]
+            local_filename = Path(key).name
+            local_path = session_path / local_filename
+            size = obj.get("Size", 0)
+
+            if size <= S3_RANGE_PART_SIZE:
+                pending.add(
+                    io_pool.submit(
+                        download_from_s3,
+                        session_id,
+                        local_filename,
+                        local_path,
+                        size,
+                    )
+                )
+            else:
+                # Preallocate so each part can be written at its offset independently.
+                fd, temp_path = tempfile.mkstemp(
+                    dir=session_path, prefix=f".{local_filename}.", suffix=".part"
+                )
+                try:
+                    os.ftruncate(fd, size)
+                finally:
+                    os.close(fd)
+                # Hold one reference until every part is queued, so parts that
+                # finish early can't complete the object
+                download = {
+                    "temp_path": temp_path,
+                    "local_path": local_path,
+                    "remaining": 1,
+                    "failed": False,
+                }
+                open_downloads[temp_path] = download
+                for start in range(0, size, S3_RANGE_PART_SIZE):
+                    end = min(start + S3_RANGE_PART_SIZE, size) - 1
+                    future = io_pool.submit(
+                        download_s3_range, key, temp_path, start, end
+                    )
+                    download["remaining"] += 1
+                    ranged_downloads[future] = download
+                    pending.add(future)
+                    # Bound per part, so one huge object can't flood the shared pool
+                    while len(pending) >= S3_SYNC_MAX_PENDING:
+                        drain(FIRST_COMPLETED)
+                release(download)
+
+            while len(pending) >= S3_SYNC_MAX_PENDING:
+                drain(FIRST_COMPLETED)
+
+        while pending:
+            drain(FIRST_COMPLETED)
+    finally:
+        for future in pending:
+            future.cancel()
+        # Let in-flight parts finish before discarding incomplete temp files
+        wait(pending)
+        for temp_path in open_downloads:
+            try:
+                os.unlink(temp_path)
+            except FileNotFoundError:
+                pass
+
+
+# --- Session Containers ---
+# Session containers carry the raw session id in this label; their names are a
+# digest of it, since Docker names only allow [a-zA-Z0-9][a-zA-Z0-9_.-]+.
+SESSION_CONTAINER_LABEL = "pyexec.session"
+
+# Local cache of running session containers; the container name is the source of
+# truth so that multiple workers share one container per session.
+session_containers: Dict[str, Any] = {}
+# One lock per session, so starting one session's container doesn't hold up others
+session_container_locks: Dict[str, threading.Lock] = {}
+session_container_locks_lock = threading.Lock()
+
+
+def get_session_container_name(session_id: str) -> str:
+    """Get the Docker container name for a session."""
+    digest = hashlib.sha1(session_id.encode("utf-8")).hexdigest()
+    return f"pyexec-session-{digest}"
+
+
+def get_session_container_lock(session_id: str) -> threading.Lock:
+    """Get the lock guarding creation of a session's container."""
+    with session_container_locks_lock:
+        return session_container_locks.setdefault(session_id, threading.Lock())
+
+
+def touch_session(session_dir: str):
+    """Mark a session as used now.
+
+    The session directory's mtime is the idle clock, so every worker (and a
+    restarted process) sees the same last-used time.
+    """
+    try:
+        os.utime(session_dir)
+    except FileNotFoundError:
+        pass
+
+
+def get_or_create_session_container(session_id: str, session_dir: str):
+    """Get the long-lived container for a session, starting one if needed."""
+    container = session_containers.get(session_id)
+    if container is not None:
+        return container
+
+    name = get_session_container_name(session_id)
+    with get_session_container_lock(session_id):
+        container = session_containers.get(session_id)
+        if container is not None:
+            return container
+
+        try:
+            container = get_docker_client().containers.get(name)
+        except docker.errors.NotFound:
+            container = None
+        if container is not None and container.status != "running":
+            container.remove(force=True)
+            container = None
+
+        if container is None:
+            try:
+                container = get_docker_client().containers.run(
+                    image=BASE_IMAGE_NAME,
+                    command=["sleep", "infinity"],
+                    name=name,
+                    labels={SESSION_CONTAINER_LABEL: session_id},
+                    volumes={session_dir: {"bind": "/app", "mode": "rw"}},
+                    working_dir="/app",
+                    user="appuser",
+                    mem_limit="256m",
+                    cpu_shares=512,
+                    network_disabled=True,
+                    detach=True,
+                )
+            except docker.errors.APIError as e:
+                # Another worker created it first
+                if e.status_code != 409:
+                    raise
+                container = get_docker_client().containers.get(name)
+
+        session_containers[session_id] = container
+    return container
+
+
+def forget_session_container(session_id: str, container):
+    """Drop a cached container that turned out to be gone or stopped."""
+    with get_session_container_lock(session_id):
+        if session_containers.get(session_id) is container:
+            del session_containers[session_id]
+
+
+def is_missing_container_error(e: Exception) -> bool:
+    """Check whether a Docker error means the container is gone or not running."""
+    return isinstance(e, docker.errors.NotFound) or (
+        isinstance(e, docker.errors.APIError) and e.status_code == 409
+    )
+
+
+def remove_session_container(session_id: str):
+    """Stop and remove a session's container, if it exists."""
+    with get_session_container_lock(session_id):
+        container = session_containers.pop(session_id, None)
+    with session_container_locks_lock:
+        session_container_locks.pop(session_id, None)
+
+    try:
+        if container is None:
+            container = get_docker_client().containers.get(
+                get_session_container_name(session_id)
+            )
+        container.remove(force=True)
+    except docker.errors.NotFound:
+        pass
+
+
+def session_container_has_running_execs(container) -> bool:
+    """Ask Docker whether any process is still executing in a container.
+
+    This covers executions started by every worker, not just this process.
+    """
+    container.reload()
+    api = get_docker_client().api
+    for exec_id in container.attrs.get("ExecIDs") or []:
+        try:
+            if api.exec_inspect(exec_id)["Running"]:
+                return True
+        except docker.errors.NotFound:
+            continue
+    return False
+
+
+def get_session_last_used(session_id: str) -> float:
+    """Get when a session was last used, or 0 if its directory is gone."""
+    try:
+        return os.stat(get_session_path(session_id)).st_mtime
+    except OSError:
+        return 0.0
 
-    client = docker.from_env()
-    venv_python = get_session_venv_path(session_path)
+
+def reap_idle_containers():
+    """Remove session containers that have been idle for longer than the timeout.
+
+    Works from the labelled containers Docker reports, so containers left behind
+    by a restart or by another worker are swept too.
+    """
+    cutoff = time.time() - settings.SESSION_CONTAINER_IDLE_TIMEOUT
+    containers = get_docker_client().containers.list(
+        all=True, filters={"label": SESSION_CONTAINER_LABEL}
+    )
+    for container in containers:
+        session_id = container.labels.get(SESSION_CONTAINER_LABEL, "")
+        try:
+            if get_session_last_used(session_id) > cutoff:
+                continue
+            if session_container_has_running_execs(container):
+                continue
+            logger.info(f"Removing idle container for session {session_id}")
+            with get_session_container_lock(session_id):
+                session_containers.pop(session_id, None)
+            container.remove(force=True)
+        except docker.errors.NotFound:
+            pass
+        except Exception as e:
+            logger.error(f"Error removing container for session {session_id}: {e}")
+
+
+async def reap_idle_containers_periodically():
+    """Run the idle container reaper in the background for the app's lifetime.
+
+    The first pass runs at startup to sweep containers orphaned by a restart.
+    """
+    while True:
+        try:
+            await asyncio.to_thread(reap_idle_containers)
+        except Exception as e:
+            logger.error(f"Idle container reaper failed: {e}")
+        await asyncio.sleep(settings.SESSION_CONTAINER_REAP_INTERVAL)
+
+
+# Code up to this many bytes is passed as a `python -c` argument (the kernel caps
+# a single argument at 128 KiB); anything larger is streamed to `python -` over stdin.
+MAX_INLINE_CODE_SIZE = 128 * 1024
+
+
+def exec_with_stdin(
+    container, command: List[str], data: bytes, workdir: str, environment, user: str
+):
+    """Run a command in a container with `data` on its stdin, returning (exit_code, (stdout, stderr))."""
+    api = get_docker_client().api
+    exec_id = api.exec_create(
+        container.id,
+        command,
+        stdin=True,
+        stdout=True,
+        stderr=True,
+        workdir=workdir,
+        environment=environment,
+        user=user,
+    )["Id"]
+    sock = api.exec_start(exec_id, socket=True)
+    try:
+        raw_sock = getattr(sock, "_sock", sock)
+        raw_sock.sendall(data)
+        raw_sock.shutdown(socket.SHUT_WR)
+        stdout, stderr = consume_socket_output(frames_iter(sock, tty=False), demux=True)
+    finally:
+        sock.close()
+    return api.exec_inspect(exec_id)["ExitCode"], (stdout, stderr)
+
+
+def run_in_session_container(
+    session_id: str,
+    session_dir: str,
+    python_executable: str,
+    code: str,
+    env: Dict[str, str],
+):
+    """Run code in the session's container, recreating it once if it has gone away."""
+    # The argument size limit is in bytes, so measure the encoded code
+    code_bytes = code.encode("utf-8")
+    inline = len(code_bytes) < MAX_INLINE_CODE_SIZE and b"\x00" not in code_bytes
+    for attempt in range(2):
+        container = get_or_create_session_container(session_id, session_dir)
+        try:
+            if inline:
+                return container.exec_run(
+                    [python_executable, "-c", code],
+                    workdir="/app",
+                    environment=env,
+                    user="appuser",
+                    demux=True,
+                )
+            return exec_with_stdin(
+                container,
+                [python_executable, "-"],
+                code_bytes,
+                workdir="/app",
+                environment=env,
+                user="appuser",
+            )
+        except docker.errors.APIError as e:
+            if attempt or not is_missing_container_error(e):
+                raise
+            forget_session_container(session_id, container)
+
+
+def do_execute(session_id: str, code: str, env: Dict[str, str], task_key: str):
+    """Execute code in the session's long-lived container using its virtual environment."""
+    set_status(task_key, {"status": "running"})
+
+    session_dir, venv_python = get_session_paths(session_id)
+    os.makedirs(session_dir, exist_ok=True)
 
     # Use the session's venv python if it exists, otherwise fall back to global python
-    python_executable = str(venv_python) if venv_python.exists() else "python"
+    python_executable = (
+        venv_python if venv_exists(session_id, venv_python) else "python"
+    )
 
     try:
         # Before running, sync S3 files if configured
         if s3_client:
             try:
-                paginator = s3_client.get_paginator("list_objects_v2")
-                pages = paginator.paginate(
-                    Bucket=settings.S3_BUCKET_NAME, Prefix=f"{session_id}/"
-                )
-                for page in pages:
-                    for obj in page.get("Contents", []):
-                        key = obj["Key"]
-                        local_filename = Path(key).name
-                        download_from_s3(
-                            session_id, local_filename, session_path / local_filename
-                        )
+                sync_session_from_s3(session_id, Path(session_dir))
             except Exception as e:
                 set_status(
                     task_key,
@@ -229,51 +924,25 @@ def do_execute(session_id: str, code: str, env: Dict[str, str], task_key: str):
                 )
                 return
 
-        container = client.containers.run(
-            image=settings.BASE_IMAGE_NAME,
-            command=[python_executable, "temp_code.py"],
-            volumes={str(session_path): {"bind": "/app", "mode": "rw"}},
-            working_dir="/app",
-            environment=env,
-            user="appuser",
-            mem_limit="256m",
-            cpu_shares=512,
-            network_disabled=True,
-            detach=False,
-            remove=True,
-        )
-
-        output = container.decode("utf-8")
-        # In this simple model, stdout and stderr are combined.
-        # A more advanced implementation could redirect them separately.
-        stdout = output
-        stderr = ""
-        exit_code = 0  # Success exit code
+        touch_session(session_dir)
+        try:
+            exit_code, (stdout, stderr) = run_in_session_container(
+                session_id, session_dir, python_executable, code, env
+            )
+        finally:
+            touch_session(session_dir)
 
         set_status(
             task_key,
             {
-                "status": "success",
-                "output": stdout,
-                "errors": stderr,
+                "status": "success" if exit_code == 0 else "failed",
+                "output": stdout.decode("utf-8") if stdout else "",
+                "errors": stderr.decode("utf-8") if stderr else "",
                 "exit_code": exit_code,
             },
         )
-    except docker.errors.ContainerError as e:
-        set_status(
-            task_key,
-            {
-                "status": "failed",
-                "output": e.stdout.decode("utf-8") if e.stdout else "",
-                "errors": e.stderr.decode("utf-8") if e.stderr else "",
-                "exit_code": e.exit_status,
-            },
-        )
     except Exception as e:
         set_status(task_key, {"status": "failed", "error": str(e)})
-    finally:
-        if code_file_path.exists():
-            code_file_path.unlink()
 
 
 @router.post("/install", status_code=202)
@@ -282,7 +951,9 @@ async def install_packages(
 ):
     """Install packages into a session's virtual environment in the background."""
     task_id = f"install-{request.session_id}"
-    background_tasks.add_task(do_install, request.session_id, request.packages)
+    background_tasks.add_task(
+        run_in_pool, compute_pool, do_install, request.session_id, request.packages
+    )
     return {
         "status": "install_queued",
         "session_id": request.session_id,
@@ -300,7 +971,13 @@ async def run_code(
     """Execute code in a session's dedicated Docker container in the background."""
     task_key = f"exec-{request.session_id}-{os.urandom(4).hex()}"
     background_tasks.add_task(
-        do_execute, request.session_id, request.code, request.env, task_key
+        run_in_pool,
+        compute_pool,
+        do_execute,
+        request.session_id,
+        request.code,
+        request.env,
+        task_key,
     )
     return {
         "status": "execute_queued",
@@ -312,10 +989,11 @@ async def run_code(
 @router.get("/status/{task_type}/{task_id}")
 async def get_status(task_type: str, task_id: str, api_key: str = Depends(get_api_key)):
     """Check the status of a background task."""
-    status = get_status_from_store(task_id)
+    status = await get_status_from_store(task_id)
     if not status:
         raise HTTPException(status_code=404, detail="Task not found.")
-    return status
+    # Returned as a response directly to skip FastAPI's jsonable_encoder pass
+    return ORJSONResponse(status)
 
 
 @router.post("/upload", status_code=200)
@@ -331,8 +1009,15 @@ async def create_upload_file(
 
     if s3_client:
         try:
+            extra_args = (
+                {"ContentType": file.content_type} if file.content_type else None
+            )
             s3_client.upload_fileobj(
-                file.file, settings.S3_BUCKET_NAME, f"{session_id}/{file.filename}"
+                file.file,
+                S3_BUCKET_NAME,
+                f"{session_id}/{file.filename}",
+                ExtraArgs=extra_args,
+                Config=S3_UPLOAD_CONFIG,
             )
             return {"filename": file.filename, "storage": "s3"}
         except NoCredentialsError:
@@ -347,7 +1032,7 @@ async def create_upload_file(
         session_path.mkdir(parents=True, exist_ok=True)
         file_location = session_path / file.filename
         with file_location.open("wb+") as file_object:
-            shutil.copyfileobj(file.file, file_object)
+            copy_upload(file.file, file_object)
         return {"filename": file.filename, "storage": "local"}
 
 
@@ -358,6 +1043,9 @@ def terminate_session(request: TerminateSessionRequest):
     session_id = request.session_id
     session_path = get_session_path(session_id)
 
+    remove_session_container(session_id)
+    forget_venv(session_id)
+
     if session_path.exists():
         shutil.rmtree(session_path)
         message = f"Session {session_id} terminated successfully."
@@ -377,7 +1065,7 @@ async def download_file(
             url = s3_client.generate_presigned_url(
                 "get_object",
                 Params={
-                    "Bucket": settings.S3_BUCKET_NAME,
+                    "Bucket": S3_BUCKET_NAME,
                     "Key": f"{session_id}/{filename}",
                 },
                 ExpiresIn=3600,
@@ -397,8 +1085,8 @@ async def download_file(
 
 
 @app.get("/health")
-def health_check():
-    return {"status": "ok"}
+async def health_check():
+    return ORJSONResponse({"status": "ok"})
 
 
 app.include_router(router)
@@ -21,10 +21,11 @@ def mock_docker_globally():
     Globally mocks docker.from_env() for the entire test session.
     This runs before any modules are even imported.
     """
-    with patch("docker.from_env") as mock_from_env:
-        # Configure the mock to return another mock
-        mock_docker_client = MagicMock()
-        mock_from_env.return_value = mock_docker_client
+    mock_docker_client = MagicMock()
+    with (
+        patch("docker.from_env", return_value=mock_docker_client),
+        patch("pyexec.main.get_docker_client", return_value=mock_docker_client),
+    ):
         yield mock_docker_client
 
 
@@ -49,11 +50,14 @@ def test_session(tmp_path: Path):
     Using pytest's built-in tmp_path fixture for robust cleanup.
     """
     # We need to import this here, after settings are configured
+    from pyexec import main
     from pyexec.config import settings
 
-    # Temporarily override the session path to use the test's temp directory
+    # Temporarily override the session path to use the test's temp directory.
+    # The app binds it at import, so override its copy too.
     original_path = settings.BASE_SESSION_PATH
     settings.BASE_SESSION_PATH = tmp_path
+    main.BASE_SESSION_PATH = tmp_path
 
     session_id = f"test-session-{os.urandom(4).hex()}"
     (tmp_path / session_id).mkdir()
@@ -62,6 +66,7 @@ def test_session(tmp_path: Path):
 
     # Restore original path
     settings.BASE_SESSION_PATH = original_path
+    main.BASE_SESSION_PATH = original_path
 
 
 @pytest.fixture(scope="session")
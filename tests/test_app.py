@@ -1,3 +1,6 @@
+import asyncio
+import os
+import pytest
 from unittest.mock import patch, MagicMock
 
 
@@ -75,24 +78,27 @@ def test_do_install_creates_venv_and_installs(test_session, mock_docker_globally
     from pyexec.main import do_install
     from pyexec.config import settings
 
-    mock_docker_globally.containers.run.reset_mock()
+    mock_docker_globally.containers.create.reset_mock()
+    container = mock_docker_globally.containers.create.return_value
+    container.logs.return_value = [b"ok\n"]
+    container.wait.return_value = {"StatusCode": 0}
     packages = ["numpy", "pandas"]
     session_path = settings.BASE_SESSION_PATH / test_session
     venv_python_path = str(session_path / "venv" / "bin" / "python")
 
     # Simulate that the venv does *not* exist to test the creation path
-    with patch("pathlib.Path.exists", return_value=False):
+    with patch("os.path.exists", return_value=False):
         do_install(test_session, packages)
 
-        assert mock_docker_globally.containers.run.call_count == 2
+        assert mock_docker_globally.containers.create.call_count == 2
 
         # Call 1: Create the virtual environment
-        create_venv_call = mock_docker_globally.containers.run.call_args_list[0]
+        create_venv_call = mock_docker_globally.containers.create.call_args_list[0]
         assert create_venv_call.kwargs["command"] == ["python", "-m", "venv", "venv"]
         assert str(session_path) in create_venv_call.kwargs["volumes"]
 
         # Call 2: Install packages using the new venv's pip
-        pip_install_call = mock_docker_globally.containers.run.call_args_list[1]
+        pip_install_call = mock_docker_globally.containers.create.call_args_list[1]
         assert (
             pip_install_call.kwargs["command"]
             == [
@@ -100,9 +106,70 @@ def test_do_install_creates_venv_and_installs(test_session, mock_docker_globally
                 "-m",
                 "pip",
                 "install",
+                "--prefer-binary",
+                "--disable-pip-version-check",
             ]
             + packages
         )
+        # The shared pip cache is opt-in, so only the session is mounted
+        assert list(pip_install_call.kwargs["volumes"]) == [str(session_path)]
+
+
+def test_do_install_mounts_pip_cache_when_configured(
+    test_session, mock_docker_globally
+):
+    """Tests that the shared pip cache volume is mounted only when enabled."""
+    from pyexec.main import do_install
+    from pyexec.config import settings
+
+    mock_docker_globally.containers.create.reset_mock()
+    container = mock_docker_globally.containers.create.return_value
+    container.logs.return_value = []
+    container.wait.return_value = {"StatusCode": 0}
+
+    with (
+        patch("os.path.exists", return_value=True),
+        patch.object(settings, "PIP_CACHE_VOLUME", "pyexec-pip-cache"),
+    ):
+        do_install(test_session, ["requests"])
+
+    volumes = mock_docker_globally.containers.create.call_args.kwargs["volumes"]
+    assert volumes["pyexec-pip-cache"]["bind"] == "/home/appuser/.cache/pip"
+
+
+def test_do_install_streams_logs_and_reports_failures(
+    test_session, mock_docker_globally
+):
+    """Tests that install output is published while running and failures show stderr once."""
+    from pyexec.main import do_install, get_status_from_store
+
+    mock_docker_globally.containers.create.reset_mock()
+    container = mock_docker_globally.containers.create.return_value
+    published = []
+
+    container.logs.return_value = iter(
+        [b"Collecting nope\n", b"ERROR: no matching distribution\n"]
+    )
+    container.wait.return_value = {"StatusCode": 1}
+
+    with (
+        patch("os.path.exists", return_value=True),
+        patch("pyexec.main.INSTALL_LOG_FLUSH_SIZE", 1),
+        patch(
+            "pyexec.main.update_status",
+            side_effect=lambda task_id, fields: published.append(fields["logs"]),
+        ),
+    ):
+        do_install(test_session, ["nope"])
+
+    assert published and "Collecting nope" in published[-1]
+    container.start.assert_called()
+    container.remove.assert_called_with(force=True)
+    status = asyncio.run(get_status_from_store(f"install-{test_session}"))
+    assert status["status"] == "failed"
+    assert status["exit_code"] == 1
+    assert status["logs"].endswith("Collecting nope\nERROR: no matching distribution\n")
+    assert status["logs"].count("ERROR: no matching distribution") == 1
 
 
 def test_do_execute_uses_venv_or_falls_back(test_session, mock_docker_globally):
@@ -110,22 +177,441 @@ def test_do_execute_uses_venv_or_falls_back(test_session, mock_docker_globally):
     Tests the logic of the do_execute background task, ensuring it uses the
     session's virtual environment if it exists, and falls back otherwise.
     """
-    from pyexec.main import do_execute, get_session_venv_path
+    from pyexec.main import do_execute, get_session_venv_path, get_status_from_store
+    from pyexec.main import forget_venv
     from pyexec.config import settings
 
-    mock_docker_globally.containers.run.reset_mock()
     session_path = settings.BASE_SESSION_PATH / test_session
     venv_python_path = get_session_venv_path(session_path)
     code, task_key = "print(1)", "exec-123"
 
+    container = mock_docker_globally.containers.get.return_value
+    container.status = "running"
+    container.exec_run.reset_mock()
+    container.exec_run.return_value = (0, (b"1\n", None))
+
     # Case 1: Venv exists, so it should be used
-    with patch("pathlib.Path.exists", return_value=True):
+    with patch("os.path.exists", return_value=True):
         do_execute(test_session, code, {}, task_key)
-        run_call = mock_docker_globally.containers.run.call_args
-        assert run_call.kwargs["command"][0] == str(venv_python_path)
+        exec_call = container.exec_run.call_args
+        assert exec_call.args[0] == [str(venv_python_path), "-c", code]
 
-    # Case 2: Venv does not exist, so it should fall back to the global python
-    with patch("pathlib.Path.exists", return_value=False):
+    # Case 2: Venv does not exist (e.g. the session was reset), so it should
+    # fall back to the global python
+    forget_venv(test_session)
+    with patch("os.path.exists", return_value=False):
         do_execute(test_session, code, {}, task_key)
+        exec_call = container.exec_run.call_args
+        assert exec_call.args[0][0] == "python"
+
+    status = asyncio.run(get_status_from_store(task_key))
+    assert status == {
+        "status": "success",
+        "output": "1\n",
+        "errors": "",
+        "exit_code": 0,
+    }
+
+
+def test_do_execute_reuses_session_container(test_session, mock_docker_globally):
+    """Tests that repeated executions in a session share one long-lived container."""
+    import docker
+    from pyexec.main import do_execute, session_containers, terminate_session
+    from pyexec.main import TerminateSessionRequest
+
+    mock_docker_globally.containers.run.reset_mock()
+    mock_docker_globally.containers.get.side_effect = docker.errors.NotFound("gone")
+    container = mock_docker_globally.containers.run.return_value
+    container.status = "running"
+    container.exec_run.return_value = (0, (b"", None))
+
+    try:
+        do_execute(test_session, "print(1)", {}, "exec-1")
+        do_execute(test_session, "print(2)", {}, "exec-2")
+
+        assert mock_docker_globally.containers.run.call_count == 1
         run_call = mock_docker_globally.containers.run.call_args
-        assert run_call.kwargs["command"][0] == "python"
+        assert run_call.kwargs["command"] == ["sleep", "infinity"]
+        assert run_call.kwargs["detach"] is True
+        assert run_call.kwargs["labels"] == {"pyexec.session": test_session}
+        assert container.exec_run.call_count == 2
+
+        terminate_session(TerminateSessionRequest(session_id=test_session))
+        assert test_session not in session_containers
+        container.remove.assert_called_with(force=True)
+    finally:
+        mock_docker_globally.containers.get.side_effect = None
+
+
+def test_do_execute_measures_inline_code_limit_in_bytes(
+    test_session, mock_docker_globally
+):
+    """Tests that multibyte code under the character limit but over it in bytes uses stdin."""
+    from pyexec.main import do_execute, MAX_INLINE_CODE_SIZE
+
+    container = mock_docker_globally.containers.get.return_value
+    container.status = "running"
+    container.exec_run.reset_mock()
+    api = mock_docker_globally.api
+    api.reset_mock()
+    api.exec_create.return_value = {"Id": "exec-id"}
+    api.exec_inspect.return_value = {"ExitCode": 0}
+    code = "# " + "\u00e9" * (MAX_INLINE_CODE_SIZE // 2)
+    assert len(code) < MAX_INLINE_CODE_SIZE < len(code.encode("utf-8"))
+
+    with (
+        patch("pyexec.main.consume_socket_output", return_value=(b"", None)),
+        patch("pyexec.main.frames_iter"),
+    ):
+        do_execute(test_session, code, {}, "exec-multibyte")
+
+    container.exec_run.assert_not_called()
+    sock = api.exec_start.return_value._sock
+    sock.sendall.assert_called_once_with(code.encode("utf-8"))
+
+
+def test_venv_exists_is_cached_until_forgotten(test_session):
+    """Tests that a found venv is remembered without re-checking the filesystem."""
+    from pyexec.main import venv_exists, forget_venv
+
+    venv_python = "/sessions/venv/bin/python"
+    with patch("os.path.exists", return_value=True) as mock_exists:
+        assert venv_exists(test_session, venv_python)
+        assert venv_exists(test_session, venv_python)
+    assert mock_exists.call_count == 1
+
+    forget_venv(test_session)
+    with patch("os.path.exists", return_value=False):
+        assert not venv_exists(test_session, venv_python)
+
+
+def test_do_execute_streams_large_code_over_stdin(test_session, mock_docker_globally):
+    """Tests that code too large for a command-line argument is sent via stdin."""
+    from pyexec.main import do_execute, get_status_from_store, MAX_INLINE_CODE_SIZE
+
+    container = mock_docker_globally.containers.get.return_value
+    container.status = "running"
+    container.exec_run.reset_mock()
+    api = mock_docker_globally.api
+    api.reset_mock()
+    api.exec_create.return_value = {"Id": "exec-id"}
+    api.exec_inspect.return_value = {"ExitCode": 0}
+    code = "x = 1\n" * (MAX_INLINE_CODE_SIZE // 6 + 1)
+
+    with (
+        patch("pyexec.main.consume_socket_output", return_value=(b"done\n", None)),
+        patch("pyexec.main.frames_iter"),
+    ):
+        do_execute(test_session, code, {}, "exec-large")
+
+    container.exec_run.assert_not_called()
+    assert api.exec_create.call_args.args[1][-1] == "-"
+    assert api.exec_create.call_args.kwargs["stdin"] is True
+    sock = api.exec_start.return_value._sock
+    sock.sendall.assert_called_once_with(code.encode("utf-8"))
+    status = asyncio.run(get_status_from_store("exec-large"))
+    assert status["output"] == "done\n"
+
+
+def test_do_execute_recreates_missing_session_container(
+    test_session, mock_docker_globally
+):
+    """Tests that a cached container that has disappeared is replaced and the run retried."""
+    import docker
+    from pyexec.main import do_execute, get_status_from_store, session_containers
+
+    gone, fresh = MagicMock(), MagicMock()
+    gone.exec_run.side_effect = docker.errors.NotFound("gone")
+    fresh.exec_run.return_value = (0, (b"ok\n", None))
+    session_containers[test_session] = gone
+
+    mock_docker_globally.containers.run.reset_mock()
+    mock_docker_globally.containers.get.side_effect = docker.errors.NotFound("gone")
+    mock_docker_globally.containers.run.return_value = fresh
+    try:
+        do_execute(test_session, "print('ok')", {}, "exec-recreate")
+    finally:
+        mock_docker_globally.containers.get.side_effect = None
+
+    assert mock_docker_globally.containers.run.call_count == 1
+    assert session_containers[test_session] is fresh
+    status = asyncio.run(get_status_from_store("exec-recreate"))
+    assert status["output"] == "ok\n"
+
+
+def test_reaper_removes_only_idle_containers_without_running_execs(
+    test_session, mock_docker_globally
+):
+    """Tests that the reaper uses Docker and the session directory, not local state."""
+    import re
+    from pyexec.main import (
+        get_session_container_name,
+        reap_idle_containers,
+        SESSION_CONTAINER_LABEL,
+    )
+    from pyexec.config import settings
+
+    session_dir = settings.BASE_SESSION_PATH / test_session
+    container = MagicMock()
+    container.labels = {SESSION_CONTAINER_LABEL: test_session}
+    container.attrs = {"ExecIDs": ["exec-a"]}
+    api = mock_docker_globally.api
+    api.reset_mock()
+    mock_docker_globally.containers.list.return_value = [container]
+
+    try:
+        # Recently used: left alone without asking Docker about execs
+        reap_idle_containers()
+        container.remove.assert_not_called()
+
+        # Idle, but another worker is still running code in it
+        os.utime(session_dir, (0, 0))
+        api.exec_inspect.return_value = {"Running": True}
+        reap_idle_containers()
+        container.remove.assert_not_called()
+        api.exec_inspect.assert_called_with("exec-a")
+
+        api.exec_inspect.return_value = {"Running": False}
+        reap_idle_containers()
+        container.remove.assert_called_once_with(force=True)
+    finally:
+        mock_docker_globally.containers.list.return_value = MagicMock()
+
+    # Names are a digest, so any session id yields a valid Docker name
+    name = get_session_container_name("user@example.com: my session")
+    assert re.fullmatch(r"[a-zA-Z0-9][a-zA-Z0-9_.-]+", name)
+
+
+def test_status_reads_from_store(client):
+    """Tests that /status returns a stored task status and 404s for unknown tasks."""
+    from pyexec.main import set_status
+
+    set_status("exec-status-test", {"status": "running"})
+    response = client.get("/status/execute/exec-status-test")
+    assert response.status_code == 200
+    assert response.json() == {"status": "running"}
+
+    response = client.get("/status/execute/does-not-exist")
+    assert response.status_code == 404
+
+
+def test_sync_session_from_s3_assembles_ranged_parts(test_session):
+    """Tests that large S3 objects are fetched as byte ranges and reassembled in place."""
+    import io
+    from pyexec.main import sync_session_from_s3
+    from pyexec.config import settings
+
+    session_path = settings.BASE_SESSION_PATH / test_session
+    payload = b"0123456789"
+
+    def fake_get_object(Bucket, Key, Range=None):
+        if Range is None:
+            return {"Body": io.BytesIO(b"abc")}
+        start, end = map(int, Range.removeprefix("bytes=").split("-"))
+        return {"Body": io.BytesIO(payload[start : end + 1])}
+
+    mock_s3 = MagicMock()
+    mock_s3.list_objects_v2.side_effect = [
+        {
+            "Contents": [{"Key": f"{test_session}/small.txt", "Size": 3}],
+            "IsTruncated": True,
+            "NextContinuationToken": "page-2",
+        },
+        {
+            "Contents": [{"Key": f"{test_session}/large.bin", "Size": len(payload)}],
+            "IsTruncated": False,
+        },
+    ]
+    mock_s3.get_object.side_effect = fake_get_object
+
+    with (
+        patch("pyexec.main.s3_client", mock_s3),
+        patch("pyexec.main.S3_RANGE_PART_SIZE", 4),
+    ):
+        sync_session_from_s3(test_session, session_path)
+
+    assert (session_path / "large.bin").read_bytes() == payload
+    assert (session_path / "small.txt").read_bytes() == b"abc"
+    assert not list(session_path.glob("*.part"))
+    # One plain GET for the small file, three ranged GETs for the large one
+    assert mock_s3.get_object.call_count == 4
+    mock_s3.download_file.assert_not_called()
+    assert mock_s3.list_objects_v2.call_args.kwargs["ContinuationToken"] == "page-2"
+
+
+def test_sync_session_from_s3_bounds_queued_parts_of_large_object(test_session):
+    """Tests that one large object never queues more parts than the sync allows."""
+    import io
+    from pyexec import main
+    from pyexec.main import sync_session_from_s3
+    from pyexec.config import settings
+
+    session_path = settings.BASE_SESSION_PATH / test_session
+    payload = bytes(range(40))
+    submitted = []
+
+    def fake_get_object(Bucket, Key, Range):
+        start, end = map(int, Range.removeprefix("bytes=").split("-"))
+        return {"Body": io.BytesIO(payload[start : end + 1])}
+
+    real_pool = main.io_pool
+
+    def tracking_submit(fn, *args):
+        # The sync drains before queueing once S3_SYNC_MAX_PENDING is reached
+        assert sum(not f.done() for f in submitted) < 2
+        submitted.append(real_pool.submit(fn, *args))
+        return submitted[-1]
+
+    mock_s3 = MagicMock()
+    mock_s3.list_objects_v2.return_value = {
+        "Contents": [{"Key": f"{test_session}/large.bin", "Size": len(payload)}],
+        "IsTruncated": False,
+    }
+    mock_s3.get_object.side_effect = fake_get_object
+    mock_pool = MagicMock()
+    mock_pool.submit.side_effect = tracking_submit
+
+    with (
+        patch("pyexec.main.s3_client", mock_s3),
+        patch("pyexec.main.io_pool", mock_pool),
+        patch("pyexec.main.S3_RANGE_PART_SIZE", 4),
+        patch("pyexec.main.S3_RANGE_CHUNK_SIZE", 3),
+        patch("pyexec.main.S3_SYNC_MAX_PENDING", 2),
+    ):
+        sync_session_from_s3(test_session, session_path)
+
+    assert len(submitted) == 10
+    assert (session_path / "large.bin").read_bytes() == payload
+    assert not list(session_path.glob("*.part"))
+
+
+def test_sync_session_from_s3_discards_object_with_failed_part(test_session):
+    """Tests that a large object is not written at all if any of its parts fails."""
+    import io
+    from pyexec.main import sync_session_from_s3
+    from pyexec.config import settings
+
+    session_path = settings.BASE_SESSION_PATH / test_session
+    (session_path / "large.bin").write_bytes(b"previous")
+
+    def fake_get_object(Bucket, Key, Range):
+        if Range == "bytes=4-7":
+            raise RuntimeError("connection reset")
+        start, end = map(int, Range.removeprefix("bytes=").split("-"))
+        return {"Body": io.BytesIO(b"0123456789"[start : end + 1])}
+
+    mock_s3 = MagicMock()
+    mock_s3.list_objects_v2.return_value = {
+        "Contents": [{"Key": f"{test_session}/large.bin", "Size": 10}],
+        "IsTruncated": False,
+    }
+    mock_s3.get_object.side_effect = fake_get_object
+
+    with (
+        patch("pyexec.main.s3_client", mock_s3),
+        patch("pyexec.main.S3_RANGE_PART_SIZE", 4),
+    ):
+        sync_session_from_s3(test_session, session_path)
+
+    assert (session_path / "large.bin").read_bytes() == b"previous"
+    assert not list(session_path.glob("*.part"))
+
+
+def test_sync_session_from_s3_aborts_on_missing_credentials(test_session):
+    """Tests that a credentials failure stops the sync instead of retrying every object."""
+    from botocore.exceptions import NoCredentialsError
+    from pyexec.main import sync_session_from_s3
+    from pyexec.config import settings
+
+    mock_s3 = MagicMock()
+    mock_s3.list_objects_v2.return_value = {
+        "Contents": [{"Key": f"{test_session}/f{i}.txt", "Size": 1} for i in range(5)],
+        "IsTruncated": False,
+    }
+    mock_s3.get_object.side_effect = NoCredentialsError()
+
+    with patch("pyexec.main.s3_client", mock_s3), pytest.raises(NoCredentialsError):
+        sync_session_from_s3(test_session, settings.BASE_SESSION_PATH / test_session)
+
+
+def test_status_cache_serves_reads_without_redis_roundtrip():
+    """Tests that recent status writes are served from the local cache ahead of Redis."""
+    from pyexec.main import set_status, get_status_from_store
+
+    mock_redis, mock_aioredis = MagicMock(), MagicMock()
+    with (
+        patch("pyexec.main.redis_clients", [mock_redis]),
+        patch("pyexec.main.aioredis_clients", [mock_aioredis]),
+    ):
+        set_status("exec-cached", {"status": "running"})
+        status = asyncio.run(get_status_from_store("exec-cached"))
+
+    assert status == {"status": "running"}
+    mock_redis.pipeline.assert_called_once_with(transaction=True)
+    mock_aioredis.hgetall.assert_not_called()
+
+
+def test_status_fields_roundtrip_through_redis_hash():
+    """Tests that status fields keep their types when stored as a Redis hash."""
+    from pyexec.main import encode_status_fields, decode_status_fields
+
+    status = {"status": "success", "output": "1\n", "errors": "", "exit_code": 0}
+    stored = {
+        key.encode("utf-8"): value
+        for key, value in encode_status_fields(status).items()
+    }
+    assert decode_status_fields(stored) == status
+
+
+def test_upload_to_s3_uses_multipart_config(client, test_session):
+    """Tests that S3 uploads use the tuned transfer config and pass the content type."""
+    from pyexec.main import S3_UPLOAD_CONFIG
+
+    mock_s3 = MagicMock()
+    with patch("pyexec.main.s3_client", mock_s3):
+        response = client.post(
+            "/upload",
+            data={"session_id": test_session},
+            files={"file": ("data.csv", b"a,b\n1,2\n", "text/csv")},
+        )
+
+    assert response.status_code == 200
+    assert response.json() == {"filename": "data.csv", "storage": "s3"}
+    upload_call = mock_s3.upload_fileobj.call_args
+    assert upload_call.kwargs["Config"] is S3_UPLOAD_CONFIG
+    assert upload_call.kwargs["ExtraArgs"] == {"ContentType": "text/csv"}
+
+
+def test_upload_to_local_storage_copies_file(client, test_session):
+    """Tests that local uploads are written intact, both in-memory and spooled to disk."""
+    from pyexec.config import settings
+
+    session_path = settings.BASE_SESSION_PATH / test_session
+    small, large = b"a,b\n1,2\n", os.urandom(3 * 1024 * 1024)
+
+    with patch("pyexec.main.s3_client", None):
+        for filename, content in (("small.csv", small), ("large.bin", large)):
+            response = client.post(
+                "/upload",
+                data={"session_id": test_session},
+                files={"file": (filename, content)},
+            )
+            assert response.status_code == 200
+            assert response.json() == {"filename": filename, "storage": "local"}
+            assert (session_path / filename).read_bytes() == content
+
+
+def test_set_status_routes_to_task_shard():
+    """Tests that status writes go to the shard chosen by the task id, under a namespaced key."""
+    from pyexec.main import set_status, get_status_shard, get_status_key
+
+    shards = [MagicMock(), MagicMock()]
+    with patch("pyexec.main.redis_clients", shards):
+        shard = get_status_shard("exec-sharded")
+        set_status("exec-sharded", {"status": "running"})
+
+    pipe = shards[shard].pipeline.return_value.__enter__.return_value
+    pipe.hset.assert_called_once()
+    assert pipe.hset.call_args.args[0] == get_status_key("exec-sharded", shard)
+    assert get_status_key("exec-sharded", shard).startswith(f"pyexec:{shard}:status:")
+    shards[1 - shard].pipeline.assert_not_called()